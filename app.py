@@ -1,31 +1,504 @@
-from flask import Flask, request, send_file, jsonify
+import os
+
+# Thread-Budget pro gunicorn-Worker: Inferenz läuft pro Prozess serialisiert über den
+# Micro-Batcher, jede Session darf also alle dem Worker zustehenden Kerne nutzen.
+# Muss vor dem Import von numpy/onnxruntime feststehen (OpenMP/BLAS lesen es beim Laden).
+GUNICORN_WORKERS = max(1, int(os.environ.get('GUNICORN_WORKERS', 1)))
+
+def _container_cpu_count():
+    """Für den Container nutzbare Kerne: CPU-Affinität, begrenzt durch die cgroup-v2-Quota
+    (cpu.max) - os.cpu_count() meldet auf Railway die Kerne des Hosts"""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()[:2]
+        if quota != 'max':
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass  # keine cgroup v2 oder kein Limit
+    return cpus
+
+_CPU_COUNT = _container_cpu_count()
+ORT_INTRA_OP_THREADS = int(os.environ.get('ORT_INTRA_OP_THREADS', max(1, _CPU_COUNT // GUNICORN_WORKERS)))
+for _var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+    os.environ.setdefault(_var, str(ORT_INTRA_OP_THREADS))
+
+from flask import Flask, Response, request
 from flask_cors import CORS
-from rembg import remove, new_session
-from PIL import Image
+from optimize_models import (
+    CUSTOM_SESSION_NAMES, MODEL_INPUT_SPECS, VARIANT_BUILDERS, get_session_class, variant_path
+)
+from PIL import Image, ImageOps, features as pil_features
+import PIL
+import numpy as np
+import cv2
+import numba
+import atexit
 import io
-import os
 import time
 import logging
+import logging.handlers
 import gc
+import hashlib
+import mmap
+import queue
+import threading
+import unicodedata
+import uuid
+import zipfile
 import psutil
-from functools import lru_cache
+import orjson
+import onnxruntime as ort
+import diskcache
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+from collections import OrderedDict
+from urllib.parse import quote
+from werkzeug.datastructures import FileStorage
+from werkzeug.http import dump_options_header
+from werkzeug.utils import secure_filename
 
 # Flask App initialisieren
 app = Flask(__name__)
 CORS(app)
 
-# Logging konfigurieren
+def _json(payload, status=200, headers=None):
+    """JSON-Response über orjson (C-Encoder) statt jsonify"""
+    return Response(orjson.dumps(payload), status=status, headers=headers, mimetype='application/json')
+
+class _ProcessQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler mit eigenem Listener-Thread pro Prozess: Request-Threads legen Records
+    nur in die Queue, geschrieben wird im Hintergrund. Der Listener startet beim ersten
+    Record im jeweiligen Prozess - unter gunicorn --preload existiert der Thread des
+    Masters in den geforkten Workern nicht."""
+
+    def __init__(self, target):
+        super().__init__(queue.SimpleQueue())
+        self._target = target
+        self._listener = None
+        self._listener_pid = None
+        self._listener_lock = threading.Lock()
+
+    def enqueue(self, record):
+        if self._listener_pid != os.getpid():
+            with self._listener_lock:
+                if self._listener_pid != os.getpid():
+                    self.queue = queue.SimpleQueue()
+                    self._listener = logging.handlers.QueueListener(self.queue, self._target)
+                    self._listener.start()
+                    self._listener_pid = os.getpid()
+        self.queue.put_nowait(record)
+
+    def flush_listener(self):
+        """Restliche Records beim Beenden noch ausgeben"""
+        if self._listener is not None and self._listener_pid == os.getpid():
+            self._listener.stop()
+            self._listener_pid = None
+
+
+# Logging konfigurieren - LOG_LEVEL=DEBUG zeigt zusätzlich die Details pro Bild
+_log_stream = logging.StreamHandler()
+_log_stream.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+_log_handler = _ProcessQueueHandler(_log_stream)
+_log_handler.setFormatter(logging.Formatter('%(message)s'))  # Zeitstempel etc. setzt _log_stream
 logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+    handlers=[_log_handler]
 )
+atexit.register(_log_handler.flush_listener)
 logger = logging.getLogger(__name__)
 
+# Gesamt-RAM ändert sich zur Laufzeit des Containers nicht - einmal beim Import lesen
+TOTAL_MEMORY_GB = psutil.virtual_memory().total / (1024**3)
+
+# Vorverarbeitung der Batch-Bilder läuft parallel, die Inferenz selbst im Batcher-Thread
+BATCH_WORKERS = min(3, _CPU_COUNT)
+
+# zlib-Stufe für die PNG-Ausgabe. Stufe 9 + optimize=True kostet auf großen RGBA-
+# Ausgaben hunderte Millisekunden für wenige Prozent kleinere Dateien.
+# Über PNG_COMPRESS_LEVEL (0-9) anpassbar, z.B. 6 wenn Bandbreite knapper ist als CPU.
+PNG_COMPRESS_LEVEL = min(9, max(0, int(os.environ.get('PNG_COMPRESS_LEVEL', 1))))
+
+# Ausgabeformate von /remove-bg: Format → (MIME-Type, Dateiendung)
+OUTPUT_FORMATS = {
+    'PNG': ('image/png', 'png'),
+    'WEBP': ('image/webp', 'webp'),
+}
+
+# Ab dieser Größe werden Uploads per mmap gelesen statt in ein bytes-Objekt kopiert
+# (Werkzeug spoolt Uploads > 500KB ohnehin in eine Temp-Datei)
+MMAP_THRESHOLD = 8 * 1024**2
+
+# RAM-Auslastung für Request-Logging, Health-Check und /system kommt aus einem
+# gemeinsamen Hintergrund-Sample statt aus /proc/meminfo-Lesevorgängen pro Anfrage
+MEMORY_SAMPLE_INTERVAL = 0.5
+# Health-Check und /system übernehmen das Sample höchstens so oft (Sekunden) - dazwischen
+# bleibt die serialisierte Antwort gültig
+MEMORY_INFO_TTL = 5.0
+
+# Kein gc.collect() pro Request (ein Vollscan dauert mit geladenen Sessions 50-200ms);
+# nur alle GC_CHECK_INTERVAL Requests prüfen und oberhalb des RSS-Limits sammeln
+GC_CHECK_INTERVAL = 20
+# Automatische Collections seltener: pro Request entstehen kaum Referenzzyklen, große
+# Puffer gibt schon der Refcount frei. (gen0, gen1, gen2) wie in gc.set_threshold
+GC_THRESHOLDS = (50000, 100, 100)
+
+def _container_memory_limit():
+    """RAM-Limit des Containers aus der cgroup v2 (memory.max) - psutil meldet den RAM des Hosts"""
+    try:
+        with open('/sys/fs/cgroup/memory.max') as f:
+            limit = f.read().strip()
+        if limit != 'max':
+            return int(limit)
+    except (OSError, ValueError):
+        pass  # keine cgroup v2 oder kein Limit
+    return psutil.virtual_memory().total
+
+# Standard: halbes Container-Limit; GC_RSS_SOFT_LIMIT_MB überschreibt
+GC_RSS_SOFT_LIMIT = int(os.environ.get('GC_RSS_SOFT_LIMIT_MB', 0)) * 1024**2 or _container_memory_limit() // 2
+
+# Zweite Cache-Stufe auf der Platte: überlebt Neustarts und Worker-Recycling
+# (--max-requests), LRU-Verdrängung ab DISK_CACHE_SIZE_MB
+DISK_CACHE_DIR = os.environ.get('DISK_CACHE_DIR', '/tmp/rembg-cache')
+DISK_CACHE_SIZE_LIMIT = int(os.environ.get('DISK_CACHE_SIZE_MB', 2048)) * 1024**2
+DISK_CACHE_EXPIRE = 24 * 3600
+
+# Schutz vor Decompression Bombs: PIL bricht ab 2× dieses Werts selbst ab,
+# process_image lehnt alles darüber schon nach dem Header ab
+Image.MAX_IMAGE_PIXELS = 50_000_000
+
+# Modellvariante: 'int8' (dynamisch quantisiert), 'fp16' (Mittelweg, falls INT8 z.B. bei
+# isnet sichtbar schlechter maskiert) oder 'fp32' (Original). Fehlende Varianten werden
+# beim Start erzeugt und neben dem Original abgelegt.
+MODEL_PRECISION = os.environ.get('MODEL_PRECISION', 'int8').lower()
+
+# Bevorzugte Execution Provider in absteigender Priorität. Verfügbar sind nur die,
+# die das installierte Paket mitbringt (onnxruntime-gpu / -directml / -openvino, CoreML
+# im macOS-Wheel - für lokale Entwicklung). ORT_PROVIDERS (kommagetrennt) überschreibt die Reihenfolge.
+PREFERRED_PROVIDERS = {
+    # HEURISTIC statt EXHAUSTIVE: kein cuDNN-Autotuning pro neuer Eingabeform (Batchgröße)
+    'CUDAExecutionProvider': {'arena_extend_strategy': 'kSameAsRequested', 'cudnn_conv_algo_search': 'HEURISTIC'},
+    'DmlExecutionProvider': {},
+    'CoreMLExecutionProvider': {},
+    'OpenVINOExecutionProvider': {'device_type': 'CPU_FP32'},
+    'CPUExecutionProvider': {},
+}
+
+@numba.njit(cache=True, fastmath=True)
+def _normalize_kernel(img_u8, out_chw, scale, mean, std):
+    """uint8 HWC → normalisiertes float32 CHW in einem einzigen Speicherdurchlauf"""
+    height, width = img_u8.shape[0], img_u8.shape[1]
+    for c in range(3):
+        c_scale = scale / std[c]
+        c_offset = mean[c] / std[c]
+        for y in range(height):
+            for x in range(width):
+                out_chw[c, y, x] = img_u8[y, x, c] * c_scale - c_offset
+
+def _to_input_tensor(pixels, model_name, pool):
+    """Bild (uint8-Array H×W×3/4) in den normalisierten NCHW-Tensor des Modells umwandeln.
+
+    Gleiche Schritte wie BaseSession.normalize (Division durch das Maximum, mean/std),
+    aber Resize per OpenCV und Normalisierung fusioniert direkt in den Zielpuffer."""
+    mean, std, size = MODEL_INPUT_SPECS[model_name]
+    arr = cv2.resize(pixels, size, interpolation=cv2.INTER_AREA)
+    if arr.shape[2] == 4:
+        # Alphakanal verwerfen (wie convert('RGB')). cvtColor statt [:, :, :3]: liefert ein
+        # zusammenhängendes Array, der numba-Kernel kommt so mit einer Signatur aus
+        arr = cv2.cvtColor(arr, cv2.COLOR_RGBA2RGB)
+    
+    tensor = pool.acquire((1, 3, size[1], size[0]))
+    _normalize_kernel(arr, tensor[0], np.float32(1 / max(int(arr.max()), 1)), mean, std)
+    return tensor
+
+# Optionale Modelle erst bei der ersten Anfrage laden, solange sie niemand nutzt kosten sie
+# keinen RAM. Standard: Hobby Plan lazy; Pro Plan lädt alles vor dem Fork (--preload teilt
+# die Gewichte zwischen den Workern). Höchstens MAX_LAZY_MODELS bleiben gleichzeitig geladen,
+# das am längsten ungenutzte wird entladen.
+LAZY_OPTIONAL_MODELS = os.environ.get('LAZY_OPTIONAL_MODELS', '0' if TOTAL_MEMORY_GB > 16 else '1') == '1'
+MAX_LAZY_MODELS = max(1, int(os.environ.get('MAX_LAZY_MODELS', 2 if TOTAL_MEMORY_GB > 16 else 1)))
+
+# Micro-Batching: gleichzeitige Anfragen (auch die Bilder eines /batch-Aufrufs) werden
+# bis zu BATCH_MAX_WAIT_MS gesammelt und als ein session.run mit bis zu BATCH_MAX_SIZE
+# Bildern ausgeführt. Hobby Plan: kleinere Batches wegen des begrenzten RAMs.
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 4 if TOTAL_MEMORY_GB > 16 else 2))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', 10))
+
+# Begrenzt gleichzeitig verarbeitete Bilder (jedes hält ein Bild in voller Auflösung im
+# RAM). Standard: so viele, wie der Batcher in einer Inferenz bündeln kann. Wer länger
+# als INFER_QUEUE_TIMEOUT wartet, bekommt 503 + Retry-After statt den Worker zu überlasten.
+MAX_CONCURRENT_INFER = int(os.environ.get('MAX_CONCURRENT_INFER', BATCH_MAX_SIZE))
+INFER_QUEUE_TIMEOUT = float(os.environ.get('INFER_QUEUE_TIMEOUT', 5))
+INFER_SEM = threading.BoundedSemaphore(MAX_CONCURRENT_INFER)
+# Obergrenze für das Warten auf die Maske aus dem Batcher - hängt dessen Thread, scheitert
+# die Anfrage, statt Slot und gunicorn-Thread bis zum Worker-Timeout zu blockieren
+INFER_RESULT_TIMEOUT = float(os.environ.get('INFER_RESULT_TIMEOUT', 120))
+
+def _select_providers():
+    """Liste der Execution Provider für ONNX Runtime bestimmen"""
+    available = ort.get_available_providers()
+    requested = os.environ.get('ORT_PROVIDERS')
+    names = [p.strip() for p in requested.split(',')] if requested else list(PREFERRED_PROVIDERS)
+    
+    providers = [
+        (name, PREFERRED_PROVIDERS.get(name, {}))
+        for name in names if name in available
+    ]
+    if not any(name == 'CPUExecutionProvider' for name, _ in providers):
+        providers.append(('CPUExecutionProvider', {}))
+    return providers
+
+def _downscale(image, size):
+    """Bild mit OpenCV statt PIL-LANCZOS verkleinern: ab Faktor < 0.5 flächengemittelt
+    (INTER_AREA, kaum Rechenaufwand), darüber INTER_LANCZOS4 für die Schärfe.
+    RGBA bleibt bei PIL: OpenCV rechnet ohne vormultipliziertes Alpha, die Farben voll
+    transparenter Pixel würden in die Kanten laufen"""
+    if image.mode not in ('RGB', 'L'):
+        return image.resize(size, Image.Resampling.LANCZOS)
+    
+    scale_factor = size[0] / image.size[0]
+    interpolation = cv2.INTER_AREA if scale_factor < 0.5 else cv2.INTER_LANCZOS4
+    resized = Image.fromarray(cv2.resize(np.asarray(image), size, interpolation=interpolation))
+    # Metadaten (u.a. EXIF-Orientierung) wie bei Image.resize übernehmen
+    resized.info.update(image.info)
+    return resized
+
+
+@numba.njit(cache=True, fastmath=True)
+def _cutout_rgb_kernel(rgb, mask, out_rgba):
+    """RGB + Maske → RGBA mit maskierten Farbkanälen in einem Durchlauf (ohne RGBA-Zwischenbild).
+    round(v * m / 255) exakt per (t + (t >> 8)) >> 8 mit t = v * m + 128 - identisch zu cv2.multiply"""
+    height, width = mask.shape
+    for y in range(height):
+        for x in range(width):
+            m = np.uint16(mask[y, x])
+            for c in range(3):
+                t = np.uint16(rgb[y, x, c]) * m + 128
+                out_rgba[y, x, c] = (t + (t >> 8)) >> 8
+            out_rgba[y, x, 3] = mask[y, x]
+
+def _apply_mask(pixels, mask):
+    """Ausschnitt wie rembgs naive_cutout (Image.composite auf transparenten Hintergrund):
+    alle vier Kanäle werden mit der Maske skaliert"""
+    if pixels.shape[2] == 3:
+        # Häufigster Fall (JPEG): Alpha-Kanal anlegen und maskieren in einem numba-Durchlauf
+        out = np.empty((mask.shape[0], mask.shape[1], 4), dtype=np.uint8)
+        _cutout_rgb_kernel(pixels, mask, out)
+        return Image.fromarray(out)
+    return Image.fromarray(cv2.multiply(pixels, cv2.merge([mask, mask, mask, mask]), scale=1 / 255))
+
+
+class ServiceBusyError(RuntimeError):
+    """Kein Inferenz-Slot innerhalb von INFER_QUEUE_TIMEOUT frei - wird mit 503 beantwortet"""
+
+
+class ImageValidationError(ValueError):
+    """Upload ist kein unterstütztes Bild oder zu groß - wird mit status_code beantwortet"""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _sniff_image_format(head):
+    """Bildformat anhand der Magic Bytes erkennen (None = nicht unterstützt)"""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'JPEG'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'PNG'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    if head[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'TIFF'
+    return None
+
+
+class ResultCache:
+    """LRU-Cache für fertige PNGs, adressiert über den Hash des Uploads"""
+
+    def __init__(self, max_entries=64, max_bytes=256 * 1024**2):
+        self._entries = OrderedDict()
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            png = self._entries.get(key)
+            if png is not None:
+                self._entries.move_to_end(key)
+            return png
+
+    def put(self, key, png):
+        if len(png) > self._max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= len(old)
+            self._entries[key] = png
+            self._total_bytes += len(png)
+
+            # Älteste Einträge verdrängen, bis beide Limits eingehalten sind
+            while len(self._entries) > self._max_entries or self._total_bytes > self._max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted)
+
+
+class ArrayPool:
+    """Nach Shape/dtype sortierte Free-Lists für wiederverwendbare numpy-Puffer"""
+
+    def __init__(self, max_per_shape=4):
+        self._free = {}
+        self._max_per_shape = max_per_shape
+        self._lock = threading.Lock()
+
+    def acquire(self, shape, dtype=np.float32):
+        """Freien Puffer passender Form holen oder neu anlegen (Inhalt undefiniert)"""
+        key = (tuple(shape), np.dtype(dtype))
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                return free.pop()
+        return np.empty(shape, dtype=dtype)
+
+    def release(self, array):
+        """Puffer zurückgeben - überzählige werden verworfen"""
+        with self._lock:
+            free = self._free.setdefault((array.shape, array.dtype), [])
+            if len(free) < self._max_per_shape:
+                free.append(array)
+
+
+class InferenceBatcher:
+    """Fasst gleichzeitige Einzelanfragen desselben Modells zu einer Batch-Inferenz zusammen"""
+
+    def __init__(self, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS):
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_pid = None
+        self._start_lock = threading.Lock()
+        # Eingabetensoren (u2net: 1.2MB, isnet: 12MB) wiederverwenden statt pro Request
+        # neu per mmap anzulegen - freigegeben wird im Worker nach session.run
+        self.input_pool = ArrayPool()
+
+    def submit(self, pixels, model_name, session):
+        """Bild vorverarbeiten und zur Inferenz einreihen - Future liefert die Rohmaske (H×W).
+        Die Session reist mit: ein inzwischen entladenes Modell rechnet so trotzdem zu Ende."""
+        # Resize + Normalisierung laufen im Request-Thread, der Worker macht nur session.run
+        tensor = _to_input_tensor(pixels, model_name, self.input_pool)
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((model_name, session, tensor, future))
+        return future
+
+    def predict(self, pixels, model_name, session):
+        """Maske als uint8-Array (H×W) in Bildgröße berechnen (entspricht session.predict von rembg)"""
+        future = self.submit(pixels, model_name, session)
+        try:
+            pred = future.result(timeout=INFER_RESULT_TIMEOUT)
+        except FutureTimeoutError:
+            raise RuntimeError(f'Inferenz mit {model_name} nach {INFER_RESULT_TIMEOUT:.0f}s abgebrochen') from None
+        
+        ma, mi = pred.max(), pred.min()
+        pred = (pred - mi) / (ma - mi)
+        mask = (pred.clip(0, 1) * 255).astype(np.uint8)
+        return cv2.resize(mask, (pixels.shape[1], pixels.shape[0]), interpolation=cv2.INTER_LINEAR)
+
+    def _ensure_worker(self):
+        # Worker erst im Prozess starten, der ihn nutzt - Threads überleben den
+        # Fork von gunicorn --preload nicht. Ein durch eine Exception beendeter
+        # Worker wird ersetzt, die Queue arbeitet der neue ab.
+        if self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker_pid != os.getpid() or not self._worker.is_alive():
+                if self._worker_pid == os.getpid():
+                    logger.error("❌ Inferenz-Batcher-Thread beendet - starte neu")
+                self._worker = threading.Thread(target=self._run, name='inference-batcher', daemon=True)
+                self._worker.start()
+                self._worker_pid = os.getpid()
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            deadline = time.monotonic() + self._max_wait
+            while len(pending) < self._max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            
+            by_session = {}
+            for model_name, session, tensor, future in pending:
+                by_session.setdefault(session, (model_name, []))[1].append((tensor, future))
+            for session, (model_name, items) in by_session.items():
+                self._run_batch(model_name, session, items)
+
+    def _run_batch(self, model_name, session, items):
+        inner_session = session.inner_session
+        model_input = inner_session.get_inputs()[0]
+        tensors = [tensor for tensor, _ in items]
+        
+        try:
+            # Nur Modelle mit dynamischer Batch-Dimension lassen sich stapeln
+            if len(items) > 1 and not isinstance(model_input.shape[0], int):
+                preds = inner_session.run(None, {model_input.name: np.concatenate(tensors)})[0][:, 0]
+                logger.info(f"📚 {model_name}: {len(items)} Bilder in einer Inferenz")
+            else:
+                preds = [inner_session.run(None, {model_input.name: tensor})[0][0, 0] for tensor in tensors]
+        except Exception as e:
+            for _, future in items:
+                future.set_exception(e)
+            return
+        finally:
+            for tensor in tensors:
+                self.input_pool.release(tensor)
+        
+        for (_, future), pred in zip(items, preds):
+            future.set_result(pred)
+
+
 class RembgAPIService:
     """REMBG API Service - Optimiert für Railway Pro Plan"""
     
     def __init__(self):
         self.sessions = {}
+        # Alle ansprechbaren Modelle (geladen + lazy); lazy geladene in LRU-Reihenfolge
+        self.available_models = []
+        self._lazy_loaded = OrderedDict()
+        self._model_fingerprints = {}
+        # Erhöht, wenn available_models sich zur Laufzeit ändert (Ladefehler eines Lazy-Modells)
+        self.models_revision = 0
+        self._load_lock = threading.Lock()
+        self._lru_lock = threading.Lock()
+        # Plan hängt nur am Gesamt-RAM und bleibt für die Lebensdauer des Containers gleich
+        self._total_gb = round(TOTAL_MEMORY_GB, 2)
+        self._is_pro = TOTAL_MEMORY_GB > 16
+        # Plan-Limits einmal festlegen statt pro Request zu verzweigen
+        self.max_pixels = 4_000_000 if self._is_pro else 1_500_000
+        self.max_file_size_mb = 20 if self._is_pro else 5
+        self.max_batch_size = 10 if self._is_pro else 3
+        self._plan_name = self._detect_railway_plan()
+        self.providers = _select_providers()
+        self.result_cache = ResultCache()
+        self.disk_cache = diskcache.Cache(
+            DISK_CACHE_DIR, size_limit=DISK_CACHE_SIZE_LIMIT, eviction_policy='least-recently-used'
+        )
+        self.batcher = InferenceBatcher()
+        self._requests_since_gc_check = 0
+        self._latest_mem = None
+        self._sampler_pid = None
+        self._sampler_lock = threading.Lock()
+        self._memory_info_cache = (0.0, None)
+        self._gc_lock = threading.Lock()
+        # Threads werden erst beim ersten submit() gestartet (wichtig für gunicorn --preload)
+        self.batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='batch')
         self.model_descriptions = {
             'u2net': 'Standard-Modell (beste Balance)',
             'silueta': 'Kompakt-Modell (schneller, 43MB)',
@@ -37,7 +510,7 @@ class RembgAPIService:
     def _detect_railway_plan(self):
         """Automatische Railway Plan-Erkennung basierend auf verfügbarem RAM"""
         try:
-            total_memory_gb = psutil.virtual_memory().total / (1024**3)
+            total_memory_gb = TOTAL_MEMORY_GB
             
             if total_memory_gb > 16:  # Pro Plan hat 32GB+
                 return "Railway Pro Plan"
@@ -49,25 +522,99 @@ class RembgAPIService:
             logger.warning(f"Plan-Erkennung fehlgeschlagen: {e}")
             return "Railway Pro Plan"  # Fallback für Pro Plan
     
-    def get_memory_info(self):
-        """Aktuelle Memory-Information für Debugging"""
+    def get_memory_info(self, fresh=False):
+        """Memory-Information für Health-Check und /system aus dem Sample des Memory-Samplers
+        (dasselbe dict für MEMORY_INFO_TTL s). fresh=True liest sofort neu, ohne den
+        Sampler-Thread zu starten - für den Start im gunicorn-Master vor dem Fork."""
+        cached_at, info = self._memory_info_cache
+        if not fresh and info is not None and time.monotonic() - cached_at < MEMORY_INFO_TTL:
+            return info
         try:
-            memory = psutil.virtual_memory()
-            return {
-                'total_gb': round(memory.total / (1024**3), 2),
+            memory = self._take_memory_sample() if fresh else self._latest_memory()
+            info = {
+                'total_gb': self._total_gb,
                 'available_gb': round(memory.available / (1024**3), 2),
                 'used_percent': round(memory.percent, 1),
-                'railway_plan': self._detect_railway_plan()
+                'railway_plan': self._plan_name
             }
         except:
             return {'error': 'Memory info nicht verfügbar'}
+        self._memory_info_cache = (time.monotonic(), info)
+        return info
+    
+    def _create_session(self, model_name):
+        """rembg-Session mit eigenen ONNX Runtime SessionOptions erstellen"""
+        session_class = get_session_class(model_name)
+        session_kwargs = {}
+        
+        # Quantisierte Variante über die passende *_custom-Session laden
+        if MODEL_PRECISION != 'fp32' and model_name in CUSTOM_SESSION_NAMES:
+            model_path = variant_path(model_name, MODEL_PRECISION)
+            if MODEL_PRECISION in VARIANT_BUILDERS and not os.path.exists(model_path):
+                try:
+                    logger.info(f"🔧 {model_name}: erzeuge {MODEL_PRECISION.upper()}-Variante (einmalig)...")
+                    VARIANT_BUILDERS[MODEL_PRECISION](model_name)
+                except Exception as e:
+                    logger.warning(f"⚠️ {MODEL_PRECISION.upper()}-Konvertierung von {model_name} fehlgeschlagen: {e}")
+            if os.path.exists(model_path):
+                session_class = get_session_class(CUSTOM_SESSION_NAMES[model_name])
+                session_kwargs['model_path'] = model_path
+                logger.info(f"📦 {model_name}: verwende {MODEL_PRECISION.upper()}-Variante {model_path}")
+            else:
+                logger.warning(f"⚠️ {model_path} fehlt (python optimize_models.py) - verwende FP32")
+        
+        sess_opts = ort.SessionOptions()
+        sess_opts.intra_op_num_threads = ORT_INTRA_OP_THREADS
+        sess_opts.inter_op_num_threads = 1
+        sess_opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        sess_opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # Arena und Speicherplan bleiben über Requests erhalten (Defaults, hier explizit);
+        # _warmup_session lässt beide vor dem ersten Request wachsen
+        sess_opts.enable_cpu_mem_arena = True
+        # DirectML unterstützt keine Memory-Patterns (ORT bricht sonst beim Laden ab)
+        sess_opts.enable_mem_pattern = not any(name == 'DmlExecutionProvider' for name, _ in self.providers)
+        session = session_class(model_name, sess_opts, providers=self.providers, **session_kwargs)
+        # Tatsächlich aktive Provider loggen - ein stiller CPU-Fallback fällt sonst nicht auf
+        logger.info(f"⚙️ {model_name} läuft auf: {session.inner_session.get_providers()}")
+        # Beim Laden evtl. erzeugte Variante: Fingerprint beim nächsten Zugriff neu bestimmen
+        self._model_fingerprints.pop(model_name, None)
+        return session
+    
+    def _model_file(self, model_name):
+        """(Pfad, Präzision) der Modelldatei, die _create_session lädt"""
+        if MODEL_PRECISION != 'fp32' and model_name in CUSTOM_SESSION_NAMES:
+            path = variant_path(model_name, MODEL_PRECISION)
+            if os.path.exists(path):
+                return path, MODEL_PRECISION
+        return os.path.join(get_session_class(model_name).u2net_home(), f"{model_name}.onnx"), 'fp32'
+    
+    def _model_fingerprint(self, model_name):
+        """Präzision, Größe und mtime der Modelldatei - Teil des Ergebnis-Cache-Keys"""
+        fingerprint = self._model_fingerprints.get(model_name)
+        if fingerprint is None:
+            path, precision = self._model_file(model_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return (precision, None)  # Datei nicht lesbar - Key ohne Stat, nicht memoisiert
+            fingerprint = (precision, stat.st_size, stat.st_mtime_ns)
+            self._model_fingerprints[model_name] = fingerprint
+        return fingerprint
     
     def _initialize_models(self):
         """Modelle beim Start laden - optimiert für Pro Plan"""
         logger.info("🚀 Starte REMBG API für freistellen.online...")
         
+        # Build-Schritt prüfen: Pillow-SIMD (Versionssuffix .postN) und libjpeg-turbo für
+        # schnelles JPEG-Dekodieren - ein stilles Zurückfallen auf Standard-Pillow fällt sonst nicht auf
+        is_simd = '.post' in PIL.__version__
+        has_turbo = pil_features.check_feature('libjpeg_turbo')
+        log = logger.info if is_simd and has_turbo else logger.warning
+        log(f"🖼️ Pillow {PIL.__version__} ({'SIMD' if is_simd else 'ohne SIMD'}), "
+            f"libjpeg-turbo: {'ja' if has_turbo else 'nein'}")
+        
         # Memory-Check vor Model-Loading
-        memory_info = self.get_memory_info()
+        memory_info = self.get_memory_info(fresh=True)
         logger.info(f"💾 Verfügbares RAM: {memory_info.get('total_gb', 'N/A')}GB")
         logger.info(f"📊 Railway Plan: {memory_info.get('railway_plan', 'N/A')}")
         
@@ -77,7 +624,8 @@ class RembgAPIService:
         for model_name in essential_models:
             try:
                 logger.info(f"Lade {model_name}...")
-                self.sessions[model_name] = new_session(model_name)
+                self.sessions[model_name] = self._create_session(model_name)
+                self.available_models.append(model_name)
                 logger.info(f"✅ {model_name} erfolgreich geladen")
             except Exception as e:
                 logger.error(f"❌ Fehler beim Laden von {model_name}: {e}")
@@ -86,42 +634,243 @@ class RembgAPIService:
         optional_models = ['u2net_human_seg']
         
         # Mit Pro Plan können wir aggressiver laden
-        if memory_info.get('total_gb', 0) > 16:
+        if self._is_pro:
             logger.info("🚀 Pro Plan erkannt - lade alle verfügbaren Modelle")
             optional_models.extend(['isnet-general-use']) # Weitere Modelle möglich
             
         for model_name in optional_models:
+            if LAZY_OPTIONAL_MODELS:
+                self.available_models.append(model_name)
+                logger.info(f"⏳ Optional: {model_name} wird bei der ersten Anfrage geladen")
+                continue
             try:
                 logger.info(f"Lade optional: {model_name}...")
-                self.sessions[model_name] = new_session(model_name)
+                self.sessions[model_name] = self._create_session(model_name)
+                self.available_models.append(model_name)
                 logger.info(f"✅ {model_name} geladen")
             except Exception as e:
                 logger.warning(f"⚠️ Optional: {model_name} nicht geladen - {e}")
         
-        logger.info(f"🎉 API bereit! Verfügbare Modelle: {list(self.sessions.keys())}")
+        # Kein Warmup hier: unter gunicorn --preload läuft der Import im Master. Aufgewärmt
+        # wird pro Worker über warmup_models() (post_worker_init in gunicorn.conf.py)
+        logger.info(f"🎉 API bereit! Verfügbare Modelle: {self.available_models}")
         
         # Final Memory-Check
-        final_memory = self.get_memory_info()
+        final_memory = self.get_memory_info(fresh=True)
         logger.info(f"💾 Nach Model-Loading: {final_memory.get('used_percent', 'N/A')}% RAM verwendet")
     
-    def process_image(self, image_file, model_name='u2net', max_size=2000):
-        """Bild verarbeiten - optimiert für Pro Plan Ressourcen"""
+    def warmup_models(self):
+        """Alle geladenen Sessions im aktuellen Prozess aufwärmen - einmal pro Worker vor
+        der ersten Anfrage, damit Arena, Kernel-Auswahl und Eingabepuffer dem Worker gehören"""
+        for model_name, session in list(self.sessions.items()):
+            self._warmup_session(model_name, session, self.batcher.input_pool)
+    
+    def _warmup_session(self, model_name, session, pool):
+        """Dummy-Inferenz über denselben Pfad wie echte Requests, damit Graph-Optimierung,
+        Kernel-Auswahl und Memory-Arena nicht beim ersten Request anfallen"""
+        warmup_pixels = np.asarray(Image.effect_noise((320, 320), 64).convert('RGB'))
+        try:
+            warmup_start = time.time()
+            # Kompiliert beim ersten Modell auch die numba-Kernel (bzw. lädt sie aus dem Cache):
+            # Normalisierung hier, den RGB-Ausschnitt über _apply_mask auf der Ausgabe
+            tensor = _to_input_tensor(warmup_pixels, model_name, pool)
+            model_input = session.inner_session.get_inputs()[0]
+            session.inner_session.run(None, {model_input.name: tensor})
+            _apply_mask(warmup_pixels, np.zeros(warmup_pixels.shape[:2], dtype=np.uint8))
+            
+            # Kernels sind shape-spezifisch - auch die volle Batchgröße des Batchers vorbereiten
+            if not isinstance(model_input.shape[0], int) and BATCH_MAX_SIZE > 1:
+                batch = np.repeat(tensor, BATCH_MAX_SIZE, axis=0)
+                session.inner_session.run(None, {model_input.name: batch})
+            pool.release(tensor)
+            
+            logger.info(f"🔥 {model_name} aufgewärmt in {time.time() - warmup_start:.2f}s")
+        except Exception as e:
+            logger.warning(f"⚠️ Warmup für {model_name} fehlgeschlagen: {e}")
+    
+    def _get_session(self, model_name):
+        """Session zum Modell; optionale Modelle werden beim ersten Zugriff geladen und
+        als LRU auf MAX_LAZY_MODELS begrenzt"""
+        session = self.sessions.get(model_name)
+        if session is not None:
+            with self._lru_lock:
+                if model_name in self._lazy_loaded:
+                    self._lazy_loaded.move_to_end(model_name)
+            return session
+        
+        with self._load_lock:
+            session = self.sessions.get(model_name)
+            if session is not None:
+                return session
+            
+            load_start = time.time()
+            try:
+                session = self._create_session(model_name)
+            except Exception:
+                # Nicht erneut versuchen - weitere Anfragen fallen auf u2net zurück. Bereits
+                # entfernt (z.B. u2net nach Ladefehler beim Start): nur den Ladefehler melden
+                if model_name in self.available_models:
+                    self.available_models.remove(model_name)
+                    self.models_revision += 1
+                raise
+            self._warmup_session(model_name, session, self.batcher.input_pool)
+            
+            with self._lru_lock:
+                while len(self._lazy_loaded) >= MAX_LAZY_MODELS:
+                    evicted, _ = self._lazy_loaded.popitem(last=False)
+                    # Laufende Inferenzen halten ihre Referenz, danach gibt der Refcount ORT frei
+                    del self.sessions[evicted]
+                    logger.info(f"♻️ {evicted} entladen (MAX_LAZY_MODELS={MAX_LAZY_MODELS})")
+                self._lazy_loaded[model_name] = None
+                self.sessions[model_name] = session
+            
+            logger.info(f"✅ {model_name} bei Bedarf geladen in {time.time() - load_start:.2f}s")
+            return session
+    
+    def _latest_memory(self):
+        """Letztes psutil-Sample; startet den Sampler-Thread beim ersten Aufruf im Worker"""
+        if self._sampler_pid != os.getpid():
+            with self._sampler_lock:
+                if self._sampler_pid != os.getpid():
+                    self._take_memory_sample()
+                    threading.Thread(target=self._sample_memory, name='memory-sampler', daemon=True).start()
+                    self._sampler_pid = os.getpid()
+        return self._latest_mem
+    
+    def _take_memory_sample(self):
+        """psutil-Sample lesen und als letztes Sample für Logging und Health-Check ablegen"""
+        self._latest_mem = psutil.virtual_memory()
+        return self._latest_mem
+    
+    def _sample_memory(self):
+        while True:
+            time.sleep(MEMORY_SAMPLE_INTERVAL)
+            self._take_memory_sample()
+    
+    def _maybe_collect_garbage(self):
+        """Zyklische Garbage Collection nur bei hohem Speicherverbrauch anstoßen"""
+        with self._gc_lock:
+            self._requests_since_gc_check += 1
+            if self._requests_since_gc_check < GC_CHECK_INTERVAL:
+                return
+            self._requests_since_gc_check = 0
+        
+        rss = psutil.Process().memory_info().rss
+        if rss > GC_RSS_SOFT_LIMIT:
+            gc.collect()
+            logger.info(f"🧹 GC bei {rss / 1024**2:.0f}MB RSS (Limit {GC_RSS_SOFT_LIMIT / 1024**2:.0f}MB)")
+    
+    def _disk_cache_get(self, key):
+        """PNG aus dem Platten-Cache lesen - Fehler (z.B. gesperrte DB) zählen als Miss"""
+        try:
+            return self.disk_cache.get(key)
+        except Exception as e:
+            logger.warning(f"⚠️ Disk-Cache nicht lesbar: {e}")
+            return None
+    
+    def _disk_cache_set(self, key, png):
+        """PNG im Platten-Cache ablegen - ein voller Datenträger darf den Request nicht scheitern lassen"""
+        try:
+            self.disk_cache.set(key, png, expire=DISK_CACHE_EXPIRE)
+        except Exception as e:
+            logger.warning(f"⚠️ Disk-Cache nicht beschreibbar: {e}")
+    
+    def _read_upload(self, image_file):
+        """Upload-Inhalt bereitstellen: kleine Dateien als bytes, große als read-only mmap
+        auf die Temp-Datei - Hash und Decoder lesen dann direkt aus dem Page-Cache"""
+        stream = image_file.stream
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+        stream.seek(0)
+        
+        if size >= MMAP_THRESHOLD:
+            try:
+                return mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+            except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+                pass  # Kein echter Datei-Deskriptor (z.B. BytesIO) - normal lesen
+        return stream.read()
+    
+    def _select_model(self, model_name):
+        """Angefragtes Modell, falls verfügbar - sonst Fallback auf u2net"""
+        if model_name not in self.available_models:
+            logger.warning(f"Modell '{model_name}' nicht verfügbar, verwende 'u2net'")
+            return 'u2net'
+        return model_name
+    
+    def process_image(self, image_file, model_name='u2net', max_size=2000, output_format='PNG', session=None):
+        """Bild verarbeiten - liefert (PNG- bzw. WebP-Bytes, Verarbeitungszeit, verwendetes Modell).
+        session: bereits per _get_session aufgelöste Session des Modells (sonst hier geladen)"""
         start_time = time.time()
+        raw = None
+        # Details pro Bild nur mit LOG_LEVEL=DEBUG formatieren
+        log_debug = logger.isEnabledFor(logging.DEBUG)
         
         try:
             # Pre-processing Memory-Check
-            memory_before = psutil.virtual_memory().percent
+            if log_debug:
+                memory_before = self._latest_memory().percent
             
-            # Bild laden
-            image = Image.open(image_file.stream)
+            # Modell auswählen mit Fallback
+            model_name = self._select_model(model_name)
+            
+            # Identische Uploads (Retry, Modellvergleich) direkt aus dem Cache bedienen
+            raw = self._read_upload(image_file)
+            if _sniff_image_format(raw[:12]) is None:
+                raise ImageValidationError('Nicht unterstütztes Dateiformat (erlaubt: JPG, PNG, WebP, TIFF)', 415)
+            # Session vor dem Key auflösen: ein Lazy-Modell wird erst dabei heruntergeladen bzw.
+            # als Variante erzeugt, der Fingerprint muss die tatsächlich geladene Datei beschreiben
+            if session is None:
+                session = self._get_session(model_name)
+            # Modell-Fingerprint im Key: nach Wechsel von MODEL_PRECISION oder einem Modell-Update
+            # liefert der Platten-Cache (überlebt Neustarts) keine alten Masken mehr
+            cache_key = (hashlib.blake2b(raw, digest_size=16).digest(), model_name, self._model_fingerprint(model_name),
+                         max_size, output_format)
+            cached_png = self.result_cache.get(cache_key)
+            if cached_png is None:
+                cached_png = self._disk_cache_get(cache_key)
+                if cached_png is not None:
+                    self.result_cache.put(cache_key, cached_png)
+            if cached_png is not None:
+                processing_time = time.time() - start_time
+                logger.info(f"♻️ Cache-Treffer ({len(cached_png) / 1024:.0f} KB) in {processing_time:.3f}s")
+                return cached_png, processing_time, model_name
+            
+            # Bild laden (mmap unterstützt read/seek/tell direkt, bytes brauchen einen BytesIO)
+            try:
+                image = Image.open(raw if isinstance(raw, mmap.mmap) else io.BytesIO(raw))
+            except Image.DecompressionBombError as e:
+                raise ImageValidationError(str(e), 413) from e
+            except OSError as e:  # UnidentifiedImageError, abgeschnittener Header
+                raise ImageValidationError('Bilddatei nicht lesbar', 415) from e
             original_size = image.size
             original_pixels = original_size[0] * original_size[1]
             
-            logger.info(f"📸 Originalbildgröße: {original_size} ({original_pixels:,} Pixel)")
+            # Bisher ist nur der Header gelesen - zu große Bilder vor dem Dekodieren ablehnen
+            if original_pixels > Image.MAX_IMAGE_PIXELS:
+                raise ImageValidationError(
+                    f'Bild zu groß: {original_pixels:,} Pixel (Maximum: {Image.MAX_IMAGE_PIXELS:,})', 413
+                )
             
-            # Pro Plan kann größere Bilder verarbeiten
-            max_pixels = 4000000 if psutil.virtual_memory().total > 16 * (1024**3) else 1500000
+            if log_debug:
+                logger.debug(f"📸 Originalbildgröße: {original_size} ({original_pixels:,} Pixel)")
             
+            # Pro Plan kann größere Bilder verarbeiten
+            max_pixels = self.max_pixels
+
+            # Shrink-on-Load: Image.open hat bisher nur den Header gelesen. Bei JPEGs
+            # dekodiert libjpeg per DCT-Skalierung direkt in 1/2, 1/4 oder 1/8 Auflösung,
+            # die LANCZOS-Skalierung unten übernimmt dann nur noch den Rest.
+            if image.format == 'JPEG':
+                if original_pixels > max_pixels:
+                    draft_scale = (max_pixels / original_pixels) ** 0.5
+                else:
+                    draft_scale = max_size / max(original_size)
+                if draft_scale < 1:
+                    image.draft('RGB', (max(1, int(original_size[0] * draft_scale)),
+                                        max(1, int(original_size[1] * draft_scale))))
+                    if log_debug and image.size != original_size:
+                        logger.debug(f"⚡ JPEG Draft-Dekodierung: {original_size} → {image.size}")
+
             # Intelligente Größenanpassung
             if original_pixels > max_pixels:
                 # Berechne optimale Größe basierend auf Pixel-Count
@@ -129,95 +878,157 @@ class RembgAPIService:
                 new_width = int(original_size[0] * scale_factor)
                 new_height = int(original_size[1] * scale_factor)
                 
-                image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                logger.info(f"🔄 Intelligente Skalierung: {original_size} → {image.size}")
+                image = _downscale(image, (new_width, new_height))
+                if log_debug:
+                    logger.debug(f"🔄 Intelligente Skalierung: {original_size} → {image.size}")
             elif max(image.size) > max_size:
-                # Fallback: Standard-Thumbnail
-                image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-                logger.info(f"📏 Standard-Verkleinerung: {original_size} → {image.size}")
-            
-            # Modell auswählen mit Fallback
-            if model_name not in self.sessions:
-                logger.warning(f"Modell '{model_name}' nicht verfügbar, verwende 'u2net'")
-                model_name = 'u2net'
+                # Fallback: Standard-Thumbnail (längste Seite auf max_size)
+                scale_factor = max_size / max(image.size)
+                image = _downscale(image, (max(1, round(image.size[0] * scale_factor)),
+                                           max(1, round(image.size[1] * scale_factor))))
+                if log_debug:
+                    logger.debug(f"📏 Standard-Verkleinerung: {original_size} → {image.size}")
             
-            session = self.sessions[model_name]
+            # rembg arbeitet auf RGB (bzw. RGBA, dessen Alpha in den Ausschnitt eingeht) -
+            # andere Modi (P, L, CMYK, I;16 ...) einmalig hier konvertieren
+            if image.mode not in ('RGB', 'RGBA'):
+                has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+                image = image.convert('RGBA' if has_alpha else 'RGB')
             
-            # Memory cleanup vor AI-Processing
-            gc.collect()
+            # EXIF-Orientierung anwenden (rembg.remove() wird nicht mehr verwendet). Erst nach
+            # der Verkleinerung - gleiches Ergebnis, aber weniger Pixel zu drehen. in_place
+            # spart die Kopie des ganzen Bildes, die exif_transpose ohne Orientierung anlegt.
+            ImageOps.exif_transpose(image, in_place=True)
             
-            # Background entfernen
-            logger.info(f"🤖 Verarbeite mit {model_name}...")
-            result = remove(image, session=session)
+            # Background entfernen - Inferenz über den Micro-Batcher, Ausschnitt wie rembg
+            if log_debug:
+                logger.debug(f"🤖 Verarbeite mit {model_name}...")
+            # Dekodiertes Bild einmal als Array - Vorverarbeitung und Ausschnitt lesen denselben Puffer
+            pixels = np.asarray(image)
+            mask = self.batcher.predict(pixels, model_name, session)
+            result = _apply_mask(pixels, mask)
             
-            # Optimierte PNG-Ausgabe mit besserer Komprimierung
+            # Schnelle PNG-Ausgabe: Latenz ist wichtiger als die letzten Prozent Dateigröße
             output = io.BytesIO()
-            result.save(output, format='PNG', optimize=True, compress_level=9)
-            output.seek(0)
+            if output_format == 'WEBP':
+                # Verlustfrei mit schnellster Methode: schneller als PNG-Level 1, etwas kleiner
+                result.save(output, format='WEBP', lossless=True, quality=0, method=0)
+            else:
+                result.save(output, format='PNG', compress_level=PNG_COMPRESS_LEVEL)
+
+            # getvalue() übergibt den internen Puffer ohne Kopie - dieselben bytes gehen
+            # in Cache und Response
+            png_bytes = output.getvalue()
+            self.result_cache.put(cache_key, png_bytes)
+            self._disk_cache_set(cache_key, png_bytes)
             
             processing_time = time.time() - start_time
-            memory_after = psutil.virtual_memory().percent
             
-            logger.info(f"✅ Verarbeitung abgeschlossen in {processing_time:.2f}s")
-            logger.info(f"💾 Memory: {memory_before:.1f}% → {memory_after:.1f}%")
+            logger.info(f"✅ Verarbeitung abgeschlossen in {processing_time:.2f}s ({model_name}, {result.size[0]}x{result.size[1]})")
+            if log_debug:
+                logger.debug(f"💾 Memory: {memory_before:.1f}% → {self._latest_memory().percent:.1f}%")
             
-            # Memory cleanup
-            del image, result
-            gc.collect()
+            # Große Puffer sofort per Refcount freigeben
+            del image, pixels, mask, result
+            self._maybe_collect_garbage()
             
-            return output, processing_time, model_name
+            return png_bytes, processing_time, model_name
             
         except Exception as e:
             logger.error(f"❌ Verarbeitungsfehler: {e}")
-            # Emergency cleanup
-            gc.collect()
             raise
+        finally:
+            if isinstance(raw, mmap.mmap):
+                raw.close()
 
 # Service-Instanz erstellen
 rembg_service = RembgAPIService()
 
+def _process_limited(image_file, model_name='u2net', max_size=2000, output_format='PNG',
+                     queue_timeout=INFER_QUEUE_TIMEOUT):
+    """process_image mit Concurrency-Limit über INFER_SEM (queue_timeout=None wartet unbegrenzt)"""
+    # Modellwahl und Lazy-Laden vor dem Slot: Download und Session-Aufbau dauern Sekunden und
+    # würden sonst einen Inferenz-Slot belegen, während andere Anfragen in den 503 laufen
+    model_name = rembg_service._select_model(model_name)
+    session = rembg_service._get_session(model_name)
+    if not INFER_SEM.acquire(timeout=queue_timeout):
+        raise ServiceBusyError('Server ausgelastet - bitte in wenigen Sekunden erneut versuchen')
+    try:
+        return rembg_service.process_image(image_file, model_name, max_size, output_format, session)
+    finally:
+        INFER_SEM.release()
+
+# Alle beim Start erzeugten Objekte (Sessions, Modelle) in die permanente Generation
+# verschieben - spätere GC-Läufe scannen sie nicht mehr, und unter gunicorn --preload
+# bleiben ihre Seiten nach dem Fork geteilt
+gc.freeze()
+gc.set_threshold(*GC_THRESHOLDS)
+
+# Statischer Teil der Health-Antwort - Modelle und Plan stehen nach dem Start fest,
+# pro Aufruf kommen nur die aktuellen RAM-Werte dazu
+_HEALTH_STATIC = {
+    "status": "online",
+    "service": "freistellen.online REMBG API",
+    "version": "2.0",
+    "powered_by": rembg_service._plan_name,
+    "available_models": rembg_service.available_models,
+    "endpoints": {
+        "remove_background": "/remove-bg",
+        "batch_process": "/batch",
+        "models": "/models",
+        "health": "/",
+        "system": "/system",
+        "test_interface": "/test",
+        "demo_page": "/demo"
+    },
+    "usage": {
+        "single_image": "POST /remove-bg with 'image' file",
+        "batch": "POST /batch with 'images' files -> multipart/mixed (PNG parts + JSON metadata), or ZIP with manifest.json via 'Accept: application/zip' / format=zip",
+        "model_selection": "Add 'model' parameter (u2net, silueta, human)",
+        "size_limit": "Add 'max_size' parameter (default: 2000px for Pro Plan)",
+        "output_format": "PNG by default, lossless WebP on /remove-bg with 'Accept: image/webp'",
+        "supported_formats": "JPG, PNG, WebP, TIFF"
+    },
+    "limits": {
+        "max_image_size": "Pro Plan: 10MB+ | Hobby Plan: 2MB",
+        "batch_processing": "Pro Plan: 10 images | Hobby Plan: 3 images",
+        "max_resolution": "Pro Plan: 4K+ | Hobby Plan: 1500px"
+    }
+}
+
+class _SnapshotJson:
+    """Serialisierte JSON-Antwort zum letzten Memory-Snapshot: get_memory_info liefert
+    innerhalb von MEMORY_INFO_TTL dasselbe dict, bis dahin werden dieselben Bytes gesendet"""
+
+    def __init__(self, build):
+        self._build = build
+        self._entry = (None, b'')
+
+    def response(self):
+        memory_info = rembg_service.get_memory_info()
+        cached_info, body = self._entry
+        if memory_info is not cached_info:
+            body = orjson.dumps(self._build(memory_info))
+            self._entry = (memory_info, body)
+        return Response(body, mimetype='application/json')
+
+_health_json = _SnapshotJson(lambda memory_info: {
+    **_HEALTH_STATIC,
+    "system_info": {
+        "total_memory_gb": memory_info.get('total_gb'),
+        "memory_usage_percent": memory_info.get('used_percent'),
+        "available_memory_gb": memory_info.get('available_gb')
+    }
+})
+
 @app.route('/', methods=['GET'])
 def health_check():
     """Health Check und API-Info mit dynamischer Plan-Erkennung"""
-    memory_info = rembg_service.get_memory_info()
-    
-    return jsonify({
-        "status": "online",
-        "service": "freistellen.online REMBG API",
-        "version": "2.0",
-        "powered_by": memory_info.get('railway_plan', 'Railway Pro Plan'),
-        "available_models": list(rembg_service.sessions.keys()),
-        "system_info": {
-            "total_memory_gb": memory_info.get('total_gb'),
-            "memory_usage_percent": memory_info.get('used_percent'),
-            "available_memory_gb": memory_info.get('available_gb')
-        },
-        "endpoints": {
-            "remove_background": "/remove-bg",
-            "batch_process": "/batch",
-            "models": "/models",
-            "health": "/",
-            "system": "/system",
-            "test_interface": "/test",
-            "demo_page": "/demo"
-        },
-        "usage": {
-            "single_image": "POST /remove-bg with 'image' file",
-            "model_selection": "Add 'model' parameter (u2net, silueta, human)",
-            "size_limit": "Add 'max_size' parameter (default: 2000px for Pro Plan)",
-            "supported_formats": "JPG, PNG, WebP, TIFF"
-        },
-        "limits": {
-            "max_image_size": "Pro Plan: 10MB+ | Hobby Plan: 2MB",
-            "batch_processing": "Pro Plan: 10 images | Hobby Plan: 3 images",
-            "max_resolution": "Pro Plan: 4K+ | Hobby Plan: 1500px"
-        }
-    })
+    return _health_json.response()
 
-@app.route('/test', methods=['GET'])
-def test_interface():
-    """Einfaches Test-Interface ohne komplexes HTML"""
-    return '''
+# Statische Seiten einmalig als UTF-8-Bytes mit ETag - Browser und Proxies
+# bekommen bei unverändertem Inhalt nur ein 304
+_TEST_HTML = '''
 <!DOCTYPE html>
 <html lang="de">
 <head>
@@ -428,12 +1239,23 @@ def test_interface():
     </script>
 </body>
 </html>
-    '''
+'''.encode('utf-8')
+_TEST_ETAG = hashlib.md5(_TEST_HTML).hexdigest()
 
-@app.route('/demo', methods=['GET'])  
-def demo_page():
-    """Demo-Seite - leitet zu Test weiter"""
-    return '''
+def _static_html(body, etag):
+    """HTML-Bytes mit ETag und Cache-Control ausliefern (If-None-Match → 304)"""
+    response = Response(body, mimetype='text/html')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = 3600
+    return response.make_conditional(request)
+
+@app.route('/test', methods=['GET'])
+def test_interface():
+    """Einfaches Test-Interface ohne komplexes HTML"""
+    return _static_html(_TEST_HTML, _TEST_ETAG)
+
+_DEMO_HTML = '''
 <!DOCTYPE html>
 <html>
 <head>
@@ -467,187 +1289,387 @@ def demo_page():
     </div>
 </body>
 </html>
-    '''
+'''.encode('utf-8')
+_DEMO_ETAG = hashlib.md5(_DEMO_HTML).hexdigest()
+
+@app.route('/demo', methods=['GET'])  
+def demo_page():
+    """Demo-Seite - leitet zu Test weiter"""
+    return _static_html(_DEMO_HTML, _DEMO_ETAG)
+
+# Statische Teile der System-Antwort (Plan); geladene Modelle ändern sich mit LAZY_OPTIONAL_MODELS
+_SYSTEM_STATIC = {
+    "railway_plan": rembg_service._plan_name,
+    "available_models": rembg_service.available_models,
+    "lazy_optional_models": LAZY_OPTIONAL_MODELS,
+}
+_PERFORMANCE_INFO = {
+    "can_handle_large_images": rembg_service._is_pro,
+    "recommended_max_size": 2000 if rembg_service._is_pro else 1500,
+    "batch_limit": rembg_service.max_batch_size
+}
+
+# Prozesswerte (RSS) werden zusammen mit dem Memory-Snapshot aktualisiert
+_system_json = _SnapshotJson(lambda memory_info: {
+    "system": {
+        **_SYSTEM_STATIC,
+        "loaded_models": list(rembg_service.sessions),
+        "model_count": len(rembg_service.sessions),
+        "execution_providers": {
+            name: session.inner_session.get_providers()
+            for name, session in list(rembg_service.sessions.items())
+        },
+        "memory": memory_info
+    },
+    # Unter gunicorn --preload teilen sich die Worker die Modellgewichte (Copy-on-Write):
+    # pid + RSS je Worker zeigen, ob die Seiten geteilt bleiben
+    "process": {
+        "pid": os.getpid(),
+        "rss_mb": round(psutil.Process().memory_info().rss / 1024**2, 1),
+        "gunicorn_workers": GUNICORN_WORKERS,
+        "intra_op_threads": ORT_INTRA_OP_THREADS
+    },
+    "performance": _PERFORMANCE_INFO
+})
 
 @app.route('/system', methods=['GET'])
 def system_info():
     """Detaillierte System-Information für Debugging"""
-    memory_info = rembg_service.get_memory_info()
-    
-    return jsonify({
-        "system": {
-            "railway_plan": memory_info.get('railway_plan'),
-            "memory": memory_info,
-            "loaded_models": list(rembg_service.sessions.keys()),
-            "model_count": len(rembg_service.sessions)
+    return _system_json.response()
+
+# Antwort wird nur neu aufgebaut, wenn ein Lazy-Modell nicht geladen werden konnte
+# und aus available_models entfernt wurde (models_revision)
+_MODELS_STATIC = {
+    "default": "u2net",
+    "recommendations": {
+        "general": "u2net",
+        "fast": "silueta", 
+        "people": "u2net_human_seg",
+        "high_quality": "isnet-general-use"
+    },
+    "model_info": {
+        "u2net": {"size": "176MB", "speed": "medium", "quality": "high"},
+        "silueta": {"size": "43MB", "speed": "fast", "quality": "good"},
+        "u2net_human_seg": {"size": "176MB", "speed": "medium", "quality": "excellent for humans"}
+    }
+}
+
+def _build_models_body():
+    """/models-Antwort aus der aktuellen Modellliste serialisieren"""
+    return orjson.dumps({
+        "available_models": {
+            model_name: rembg_service.model_descriptions.get(model_name, "KI-Modell für Background-Removal")
+            for model_name in list(rembg_service.available_models)
         },
-        "performance": {
-            "can_handle_large_images": memory_info.get('total_gb', 0) > 16,
-            "recommended_max_size": 2000 if memory_info.get('total_gb', 0) > 16 else 1500,
-            "batch_limit": 10 if memory_info.get('total_gb', 0) > 16 else 3
-        }
+        **_MODELS_STATIC
     })
 
+_models_body = (rembg_service.models_revision, _build_models_body())
+
 @app.route('/models', methods=['GET'])
 def get_available_models():
     """Verfügbare Modelle und Beschreibungen"""
-    available_models = {}
-    for model_name in rembg_service.sessions.keys():
-        available_models[model_name] = rembg_service.model_descriptions.get(
-            model_name, "KI-Modell für Background-Removal"
-        )
-    
-    return jsonify({
-        "available_models": available_models,
-        "default": "u2net",
-        "recommendations": {
-            "general": "u2net",
-            "fast": "silueta", 
-            "people": "u2net_human_seg",
-            "high_quality": "isnet-general-use"
-        },
-        "model_info": {
-            "u2net": {"size": "176MB", "speed": "medium", "quality": "high"},
-            "silueta": {"size": "43MB", "speed": "fast", "quality": "good"},
-            "u2net_human_seg": {"size": "176MB", "speed": "medium", "quality": "excellent for humans"}
-        }
-    })
+    global _models_body
+    revision, body = _models_body
+    current = rembg_service.models_revision
+    if revision != current:
+        body = _build_models_body()
+        _models_body = (current, body)
+    return Response(body, mimetype='application/json')
 
 @app.route('/remove-bg', methods=['POST'])
 def remove_background():
     """Hauptendpoint für Background-Removal - Pro Plan optimiert"""
     try:
+        oversized = _reject_oversized_body(rembg_service.max_file_size_mb,
+                                           'Pro Plan' if rembg_service._is_pro else 'Hobby Plan')
+        if oversized is not None:
+            return oversized
+        
         # Input-Validierung
         if 'image' not in request.files:
-            return jsonify({
+            return _json({
                 'error': 'Kein Bild gefunden',
                 'hint': 'Sende das Bild als "image" Parameter'
-            }), 400
+            }, 400)
         
         file = request.files['image']
         
         if file.filename == '':
-            return jsonify({'error': 'Leere Datei'}), 400
+            return _json({'error': 'Leere Datei'}, 400)
         
         # Parameter auslesen mit Pro Plan Defaults
         model = request.form.get('model', 'u2net')
         max_size = int(request.form.get('max_size', 2000))  # Pro Plan Default
         
         # File-Size Check basierend auf Railway Plan
-        file_size_mb = len(file.read()) / (1024 * 1024)
-        file.seek(0)  # Reset file pointer
+        file_size_mb = _upload_size_mb(file)
         
-        memory_gb = psutil.virtual_memory().total / (1024**3)
-        max_file_size = 20 if memory_gb > 16 else 5  # Pro Plan: 20MB, Hobby: 5MB
+        is_pro = rembg_service._is_pro
+        max_file_size = rembg_service.max_file_size_mb  # Pro Plan: 20MB, Hobby: 5MB
         
         if file_size_mb > max_file_size:
-            return jsonify({
+            return _json({
                 'error': f'Datei zu groß: {file_size_mb:.1f}MB',
                 'limit': f'Maximum: {max_file_size}MB',
-                'plan': 'Pro Plan' if memory_gb > 16 else 'Hobby Plan'
-            }), 413
+                'plan': 'Pro Plan' if is_pro else 'Hobby Plan'
+            }, 413)
         
         logger.info(f"📁 Neue Anfrage: {file.filename} ({file_size_mb:.1f}MB), Modell: {model}, Max-Größe: {max_size}")
         
+        # Ausgabeformat: PNG, außer der Client bevorzugt WebP (Browser-Accept, nicht */*)
+        output_format = 'WEBP' if request.accept_mimetypes.best_match(['image/png', 'image/webp']) == 'image/webp' else 'PNG'
+        
         # Bild verarbeiten
-        result_image, processing_time, used_model = rembg_service.process_image(
-            file, model, max_size
-        )
+        image_bytes, processing_time, used_model = _process_limited(file, model, max_size, output_format)
         
-        # Response mit erweiterten Metadaten
-        response = send_file(
-            result_image,
-            mimetype='image/png',
-            as_attachment=False,
-            download_name=f'freigestellt_{file.filename.rsplit(".", 1)[0]}.png'
+        # Response direkt aus den Bild-Bytes - ohne send_file-Wrapper, der den Inhalt in
+        # 8KB-Blöcken lesen würde; die bytes sind dieselben wie im Ergebnis-Cache
+        mimetype, extension = OUTPUT_FORMATS[output_format]
+        response = Response(image_bytes, mimetype=mimetype)
+        response.headers['Content-Disposition'] = _content_disposition(
+            'inline', f'freigestellt_{file.filename.rsplit(".", 1)[0]}.{extension}'
         )
+        response.vary.add('Accept')
         
         # Erweiterte Headers
         response.headers['X-Processing-Time'] = f"{processing_time:.2f}s"
         response.headers['X-Model-Used'] = used_model
         response.headers['X-Service'] = 'freistellen.online REMBG API v2.0'
-        response.headers['X-Railway-Plan'] = rembg_service._detect_railway_plan()
+        response.headers['X-Railway-Plan'] = rembg_service._plan_name
         response.headers['X-File-Size-MB'] = f"{file_size_mb:.1f}"
         
         return response
         
+    except ImageValidationError as e:
+        logger.warning(f"⚠️ Upload abgelehnt: {e}")
+        return _json({'error': str(e), 'status': 'rejected'}, e.status_code)
+    except ServiceBusyError as e:
+        logger.warning(f"⏳ {e}")
+        return _json({'error': str(e), 'status': 'busy'}, 503, {'Retry-After': str(max(1, round(INFER_QUEUE_TIMEOUT)))})
     except Exception as e:
         logger.error(f"❌ API-Fehler: {e}")
-        return jsonify({
+        return _json({
             'error': f'Verarbeitungsfehler: {str(e)}',
             'status': 'failed',
             'hint': 'Versuche ein kleineres Bild oder anderen Modell'
-        }), 500
+        }, 500)
+
+# Spielraum im Content-Length-Check für Multipart-Boundaries und weitere Formularfelder
+MULTIPART_OVERHEAD = 1024**2
+
+def _reject_oversized_body(limit_mb, plan_name):
+    """413 allein anhand des Content-Length-Headers, bevor Werkzeug den Upload einliest
+    und auf die Platte spoolt (None = Anfrage weiterverarbeiten)"""
+    length = request.content_length
+    if length is None or length <= limit_mb * 1024**2 + MULTIPART_OVERHEAD:
+        return None
+    return _json({
+        'error': f'Anfrage zu groß: {length / 1024**2:.1f}MB',
+        'limit': f'Maximum: {limit_mb}MB',
+        'plan': plan_name
+    }, 413)
+
+def _upload_size_mb(file):
+    """Upload-Größe per seek/tell - ohne den Upload zum Messen in ein bytes-Objekt zu lesen"""
+    file.stream.seek(0, os.SEEK_END)
+    size = file.stream.tell()
+    file.stream.seek(0)
+    return size / (1024 * 1024)
+
+def _content_disposition(disposition, filename):
+    """Content-Disposition wie bei send_file: Nicht-ASCII-Namen zusätzlich als filename* (RFC 5987)"""
+    try:
+        filename.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        return dump_options_header(disposition, {
+            'filename': simple, 'filename*': f"UTF-8''{quote(filename, safe='!#$&+^`|~')}"
+        })
+    return dump_options_header(disposition, {'filename': filename})
+
+def _multipart_part(boundary, payload, content_type, content_disposition, extra_headers=None):
+    """Einen Part für eine multipart/mixed-Antwort bauen"""
+    headers = (
+        f'--{boundary}\r\n'
+        f'Content-Type: {content_type}\r\n'
+        f'Content-Disposition: {content_disposition}\r\n'
+        f'Content-Length: {len(payload)}\r\n'
+        + ''.join(f'{name}: {value}\r\n' for name, value in (extra_headers or {}).items())
+        + '\r\n'
+    )
+    return headers.encode('utf-8') + payload + b'\r\n'
+
+class _ZipStreamSink(io.RawIOBase):
+    """Nicht-seekbares Ziel für zipfile: sammelt geschriebene Bytes, bis der Generator sie abholt"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
 
 @app.route('/batch', methods=['POST'])
 def batch_process():
     """Batch-Verarbeitung - Pro Plan optimiert"""
     try:
+        # Dynamisches Limit basierend auf Railway Plan
+        is_pro = rembg_service._is_pro
+        max_batch_size = rembg_service.max_batch_size
+        plan_name = "Pro Plan" if is_pro else "Hobby Plan"
+        
+        oversized = _reject_oversized_body(max_batch_size * rembg_service.max_file_size_mb, plan_name)
+        if oversized is not None:
+            return oversized
+        
         files = request.files.getlist('images')
         
         if not files or len(files) == 0:
-            return jsonify({'error': 'Keine Bilder gefunden'}), 400
-        
-        # Dynamisches Limit basierend auf Railway Plan
-        memory_gb = psutil.virtual_memory().total / (1024**3)
-        max_batch_size = 10 if memory_gb > 16 else 3
-        plan_name = "Pro Plan" if memory_gb > 16 else "Hobby Plan"
+            return _json({'error': 'Keine Bilder gefunden'}, 400)
         
         if len(files) > max_batch_size:
-            return jsonify({
+            return _json({
                 'error': f'Zu viele Bilder: {len(files)}',
                 'limit': f'Maximum: {max_batch_size} Bilder',
                 'plan': plan_name
-            }), 400
+            }, 400)
+        
+        # Gleiches Größenlimit pro Datei wie bei /remove-bg
+        max_file_size = rembg_service.max_file_size_mb
+        for file in files:
+            file_size_mb = _upload_size_mb(file)
+            if file_size_mb > max_file_size:
+                return _json({
+                    'error': f'Datei zu groß: {file.filename} ({file_size_mb:.1f}MB)',
+                    'limit': f'Maximum: {max_file_size}MB pro Bild',
+                    'plan': plan_name
+                }, 413)
         
         model = request.form.get('model', 'u2net')
+        boundary = uuid.uuid4().hex
+        
+        # Upload-Streams vom Request lösen - der Request-Teardown schließt request.files,
+        # bevor der Generator die Bilder verarbeitet hat
+        uploads = []
+        for file in files:
+            uploads.append(FileStorage(file.stream, filename=file.filename, content_type=file.content_type))
+            file.stream = io.BytesIO()
+        
+        logger.info(f"📦 Batch-Verarbeitung: {len(files)} Bilder mit {model} ({plan_name})")
+        
+        # Ausgabeformat: multipart/mixed (Standard) oder ZIP per Accept-Header bzw. format=zip
+        as_zip = (request.form.get('format') == 'zip' or
+                  request.accept_mimetypes.best_match(['multipart/mixed', 'application/zip']) == 'application/zip')
+        
         results = []
         total_time = 0
+        batch_start = time.time()
         
-        logger.info(f"📦 Batch-Verarbeitung: {len(files)} Bilder mit {model} ({plan_name})")
+        def process_uploads():
+            """Bilder parallel verarbeiten und (Ergebnis-Eintrag, PNG-Bytes) liefern, sobald fertig"""
+            nonlocal total_time
+            
+            # Bilder parallel verarbeiten - ONNX Runtime gibt während der Inferenz die GIL frei.
+            # Ohne Timeout auf INFER_SEM: die 200-Antwort streamt bereits, ein 503 ist nicht
+            # mehr möglich - die Bilder warten auf einen Slot statt einzeln zu scheitern
+            futures = {
+                rembg_service.batch_executor.submit(_process_limited, file, model, queue_timeout=None): (i, file)
+                for i, file in enumerate(uploads)
+            }
+            
+            for future in as_completed(futures):
+                i, file = futures[future]
+                try:
+                    png_bytes, proc_time, used_model = future.result()
+                    total_time += proc_time
+                    
+                    entry = {
+                        'index': i,
+                        'filename': file.filename,
+                        'success': True,
+                        'processing_time': f"{proc_time:.2f}s",
+                        'model_used': used_model,
+                        'download_name': f'freigestellt_{file.filename.rsplit(".", 1)[0]}.png'
+                    }
+                    results.append(entry)
+                    yield entry, png_bytes
+                    
+                except Exception as e:
+                    logger.error(f"Batch-Verarbeitung fehlgeschlagen für {file.filename}: {e}")
+                    results.append({
+                        'index': i,
+                        'filename': file.filename,
+                        'success': False,
+                        'error': str(e)
+                    })
+                finally:
+                    file.close()
         
-        for i, file in enumerate(files):
-            try:
-                result_image, proc_time, used_model = rembg_service.process_image(file, model)
-                total_time += proc_time
-                
-                # Als Base64 für JSON-Response
-                import base64
-                img_b64 = base64.b64encode(result_image.getvalue()).decode()
-                
-                results.append({
-                    'index': i,
-                    'filename': file.filename,
-                    'success': True,
-                    'processing_time': f"{proc_time:.2f}s",
-                    'model_used': used_model,
-                    'image_data': f"data:image/png;base64,{img_b64}"
-                })
-                
-            except Exception as e:
-                logger.error(f"Batch-Verarbeitung fehlgeschlagen für {file.filename}: {e}")
-                results.append({
-                    'index': i,
-                    'filename': file.filename,
-                    'success': False,
-                    'error': str(e)
-                })
-        
-        return jsonify({
-            'batch_results': {
-                'total_images': len(files),
-                'successful': len([r for r in results if r.get('success')]),
-                'failed': len([r for r in results if not r.get('success')]),
-                'total_time': f"{total_time:.2f}s",
-                'average_time': f"{total_time/len(files):.2f}s",
-                'railway_plan': plan_name
-            },
-            'results': results
-        })
+        def batch_metadata():
+            """Zusammenfassung nach dem letzten Bild als JSON-Bytes"""
+            results.sort(key=lambda r: r['index'])
+            return orjson.dumps({
+                'batch_results': {
+                    'total_images': len(files),
+                    'successful': len([r for r in results if r.get('success')]),
+                    'failed': len([r for r in results if not r.get('success')]),
+                    'total_time': f"{total_time:.2f}s",
+                    'average_time': f"{total_time/len(files):.2f}s",
+                    'wall_time': f"{time.time() - batch_start:.2f}s",
+                    'railway_plan': plan_name
+                },
+                'results': results
+            })
+        
+        def generate_parts():
+            """Jedes Ergebnis als eigenen PNG-Part streamen, zum Schluss der Metadaten-Part.
+            Parts kommen in Fertigstellungs-Reihenfolge - X-Index ordnet sie dem Upload zu."""
+            for entry, png_bytes in process_uploads():
+                yield _multipart_part(boundary, png_bytes, 'image/png',
+                                      _content_disposition('attachment', entry['download_name']), {
+                                          'X-Index': entry['index'],
+                                          'X-Processing-Time': entry['processing_time'],
+                                          'X-Model-Used': entry['model_used'],
+                                      })
+            yield _multipart_part(boundary, batch_metadata(), 'application/json', 'inline; name="metadata"')
+            yield f'--{boundary}--\r\n'.encode('ascii')
+        
+        def generate_zip():
+            """ZIP-Einträge streamen, zum Schluss manifest.json. PNGs sind bereits
+            deflate-komprimiert, daher ZIP_STORED ohne zweiten Kompressionslauf."""
+            sink = _ZipStreamSink()
+            with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+                for entry, png_bytes in process_uploads():
+                    # Dateinamen kommen vom Client: keine Pfadanteile (Zip-Slip), und der
+                    # Index hält gleichnamige Uploads auseinander
+                    entry['archive_name'] = f"{entry['index']:02d}_{secure_filename(entry['download_name'])}"
+                    archive.writestr(entry['archive_name'], png_bytes)
+                    yield sink.drain()
+                archive.writestr('manifest.json', batch_metadata())
+            yield sink.drain()
+        
+        if as_zip:
+            return Response(generate_zip(), mimetype='application/zip', headers={
+                'Content-Disposition': 'attachment; filename=freigestellt.zip'
+            })
+        return Response(
+            generate_parts(),
+            mimetype=f'multipart/mixed; boundary={boundary}'
+        )
         
     except Exception as e:
         logger.error(f"❌ Batch-Fehler: {e}")
-        return jsonify({'error': f'Batch-Verarbeitungsfehler: {str(e)}'}), 500
+        return _json({'error': f'Batch-Verarbeitungsfehler: {str(e)}'}, 500)
 
 # Railway spezifische Konfiguration
 if __name__ == '__main__':
@@ -660,6 +1682,8 @@ if __name__ == '__main__':
     logger.info(f"💾 Verfügbares RAM: {memory_info.total / (1024**3):.1f}GB")
     logger.info(f"📊 Railway Plan: {'Pro Plan' if memory_info.total > 16*(1024**3) else 'Hobby Plan'}")
     
+    rembg_service.warmup_models()
+    
     app.run(
         host='0.0.0.0', 
         port=port, 
@@ -0,0 +1,34 @@
+"""Gunicorn-Konfiguration für freistellen.online REMBG API
+
+Start: gunicorn -c gunicorn.conf.py app:app
+
+preload_app lädt app.py (und damit alle ONNX-Sessions) einmal im Master, die Worker
+teilen die Modellgewichte danach per Copy-on-Write. Aufgewärmt wird erst im Worker. gthread-Threads reichen für
+Parallelität, weil ONNX Runtime während der Inferenz die GIL freigibt.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Jeder Worker kostet zusätzlichen Arbeitsspeicher für Puffer und Caches - deshalb kein
+# cpu_count()*2+1. app.py liest GUNICORN_WORKERS ebenfalls und teilt die ONNX-Threads auf.
+workers = max(1, int(os.environ.get('GUNICORN_WORKERS', 1)))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = True
+
+# Große Batches auf dem Hobby Plan brauchen mehrere Minuten
+timeout = 300
+graceful_timeout = 30
+keepalive = 5
+
+# Worker regelmäßig recyceln (Fragmentierung), mit Jitter damit nicht alle gleichzeitig neu starten
+max_requests = 50
+max_requests_jitter = 10
+
+
+def post_worker_init(worker):
+    """Sessions im frisch geforkten Worker aufwärmen, bevor er Anfragen annimmt - im Master
+    würden Arena und Puffer nur per Copy-on-Write in jeden Worker kopiert"""
+    from app import rembg_service
+    rembg_service.warmup_models()
@@ -0,0 +1,212 @@
+"""Offline-Optimierung der rembg-Modelle für freistellen.online
+
+Erzeugt quantisierte Varianten der ONNX-Modelle neben den Originalen im
+rembg-Modellverzeichnis (U2NET_HOME, Standard: ~/.u2net), z.B.
+``u2net.onnx`` → ``u2net.int8.onnx`` oder ``u2net.fp16.onnx``. app.py lädt diese
+Varianten, wenn MODEL_PRECISION entsprechend gesetzt ist, und erzeugt fehlende
+Varianten beim Start selbst - das Skript dient zum Vorab-Erzeugen (z.B. im Build-Schritt).
+
+Aufruf:
+    python optimize_models.py                 # alle Modelle nach INT8 (dynamisch)
+    python optimize_models.py u2net silueta   # nur ausgewählte Modelle
+    python optimize_models.py --calibration-dir ./samples   # statisch, mit Kalibrierung
+    python optimize_models.py --precision fp16              # FP16, falls INT8 zu ungenau ist
+    python optimize_models.py --verify-dir ./holdout        # Masken-IoU gegen FP32 prüfen
+"""
+import argparse
+import logging
+import os
+
+import numpy as np
+from PIL import Image
+from rembg.sessions import sessions_class
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_MODELS = ['u2net', 'silueta', 'u2net_human_seg', 'isnet-general-use']
+
+# rembg-Session, die eine beliebige Modelldatei mit derselben Vor-/Nachverarbeitung lädt
+CUSTOM_SESSION_NAMES = {
+    'u2net': 'u2net_custom',
+    'silueta': 'u2net_custom',
+    'u2net_human_seg': 'u2net_custom',
+    'isnet-general-use': 'dis_custom',
+}
+
+# Vorverarbeitung wie in den rembg-Sessions: (mean, std, Eingabegröße)
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+MODEL_INPUT_SPECS = {
+    'u2net': (IMAGENET_MEAN, IMAGENET_STD, (320, 320)),
+    'silueta': (IMAGENET_MEAN, IMAGENET_STD, (320, 320)),
+    'u2net_human_seg': (IMAGENET_MEAN, IMAGENET_STD, (320, 320)),
+    'isnet-general-use': (np.full(3, 0.5, dtype=np.float32), np.ones(3, dtype=np.float32), (1024, 1024)),
+}
+
+CALIBRATION_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def get_session_class(model_name):
+    """rembg-Session-Klasse zu einem Modellnamen finden"""
+    session_class = next((sc for sc in sessions_class if sc.name() == model_name), None)
+    if session_class is None:
+        raise ValueError(f"Unbekanntes Modell: {model_name}")
+    return session_class
+
+
+def variant_path(model_name, precision):
+    """Pfad der Modellvariante, z.B. ~/.u2net/u2net.int8.onnx"""
+    session_class = get_session_class(model_name)
+    return os.path.join(session_class.u2net_home(), f"{model_name}.{precision}.onnx")
+
+
+def quantize_int8(model_name):
+    """FP32-Modell (falls nötig herunterladen) dynamisch auf INT8-Gewichte quantisieren"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    source = get_session_class(model_name).download_models()
+    target = variant_path(model_name, 'int8')
+    quantize_dynamic(source, target, weight_type=QuantType.QInt8)
+
+    logger.info(f"✅ {model_name}: {os.path.getsize(source) / 1024**2:.0f}MB → "
+                f"{os.path.getsize(target) / 1024**2:.0f}MB ({target})")
+    return target
+
+
+def convert_fp16(model_name):
+    """FP32-Modell nach FP16 konvertieren - Ein-/Ausgänge bleiben float32, die
+    Vorverarbeitung in app.py ändert sich nicht"""
+    import onnx
+    from onnxconverter_common import float16
+
+    source = get_session_class(model_name).download_models()
+    target = variant_path(model_name, 'fp16')
+    model = float16.convert_float_to_float16(onnx.load(source), keep_io_types=True)
+    onnx.save(model, target)
+
+    logger.info(f"✅ {model_name} (FP16): {os.path.getsize(source) / 1024**2:.0f}MB → "
+                f"{os.path.getsize(target) / 1024**2:.0f}MB ({target})")
+    return target
+
+
+# Erzeugung fehlender Varianten je MODEL_PRECISION (ohne Kalibrierungsdaten)
+VARIANT_BUILDERS = {
+    'int8': quantize_int8,
+    'fp16': convert_fp16,
+}
+
+
+class ImageCalibrationReader:
+    """Liefert Beispielbilder, vorverarbeitet wie zur Laufzeit, für quantize_static"""
+
+    def __init__(self, model_name, input_name, calibration_dir, limit=50):
+        self._mean, self._std, self._size = MODEL_INPUT_SPECS[model_name]
+        self._input_name = input_name
+        paths = sorted(
+            os.path.join(calibration_dir, name) for name in os.listdir(calibration_dir)
+            if name.lower().endswith(CALIBRATION_EXTENSIONS)
+        )[:limit]
+        if not paths:
+            raise ValueError(f"Keine Kalibrierungsbilder in {calibration_dir}")
+        self._paths = iter(paths)
+
+    def get_next(self):
+        path = next(self._paths, None)
+        if path is None:
+            return None
+        with Image.open(path) as image:
+            image = image.convert('RGB').resize(self._size, Image.Resampling.LANCZOS)
+        arr = np.asarray(image, dtype=np.float32)
+        arr /= max(arr.max(), 1e-6)
+        arr = (arr - self._mean) / self._std
+        return {self._input_name: arr.transpose(2, 0, 1)[np.newaxis].astype(np.float32)}
+
+
+def quantize_static_int8(model_name, calibration_dir, limit=50):
+    """FP32-Modell statisch auf INT8 quantisieren (Aktivierungsbereiche aus Beispielbildern)
+
+    QOperator-Format, symmetrische INT8-Gewichte pro Tensor, asymmetrische UINT8-Aktivierungen."""
+    import onnxruntime as ort
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+
+    source = get_session_class(model_name).download_models()
+    target = variant_path(model_name, 'int8')
+    input_name = ort.InferenceSession(source, providers=['CPUExecutionProvider']).get_inputs()[0].name
+
+    quantize_static(
+        source, target,
+        ImageCalibrationReader(model_name, input_name, calibration_dir, limit),
+        quant_format=QuantFormat.QOperator,
+        per_channel=False,
+        weight_type=QuantType.QInt8,
+        activation_type=QuantType.QUInt8,
+        extra_options={'WeightSymmetric': True, 'ActivationSymmetric': False},
+    )
+
+    logger.info(f"✅ {model_name} (statisch): {os.path.getsize(source) / 1024**2:.0f}MB → "
+                f"{os.path.getsize(target) / 1024**2:.0f}MB ({target})")
+    return target
+
+
+def _binary_mask(output):
+    """Modellausgabe wie in rembg min-max-normalisieren und bei 0.5 binarisieren"""
+    pred = output[0][:, 0]
+    pred = (pred - pred.min()) / max(float(pred.max() - pred.min()), 1e-6)
+    return pred > 0.5
+
+
+def verify_variant(model_name, precision, image_dir, limit=50):
+    """Mittlere Masken-IoU der Variante gegenüber dem FP32-Original auf Testbildern"""
+    import onnxruntime as ort
+
+    source = get_session_class(model_name).download_models()
+    reference = ort.InferenceSession(source, providers=['CPUExecutionProvider'])
+    variant = ort.InferenceSession(variant_path(model_name, precision), providers=['CPUExecutionProvider'])
+    reader = ImageCalibrationReader(model_name, reference.get_inputs()[0].name, image_dir, limit)
+
+    scores = []
+    for inputs in iter(reader.get_next, None):
+        expected = _binary_mask(reference.run(None, inputs))
+        actual = _binary_mask(variant.run(None, inputs))
+        union = np.logical_or(expected, actual).sum()
+        scores.append(np.logical_and(expected, actual).sum() / union if union else 1.0)
+
+    iou = float(np.mean(scores))
+    logger.info(f"🔍 {model_name} ({precision}): Masken-IoU {iou:.4f} auf {len(scores)} Bildern")
+    return iou
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='rembg-Modelle für die API optimieren')
+    parser.add_argument('models', nargs='*', default=SUPPORTED_MODELS, choices=SUPPORTED_MODELS)
+    parser.add_argument('--precision', choices=sorted(VARIANT_BUILDERS), default='int8',
+                        help='Zielpräzision (Standard: int8)')
+    parser.add_argument('--calibration-dir',
+                        help='Verzeichnis mit Beispielbildern - aktiviert statische INT8-Quantisierung')
+    parser.add_argument('--calibration-limit', type=int, default=50,
+                        help='maximale Anzahl Kalibrierungsbilder (Standard: 50)')
+    parser.add_argument('--verify-dir',
+                        help='Testbilder (nicht die Kalibrierungsbilder) - Masken-IoU gegen FP32 prüfen')
+    parser.add_argument('--min-iou', type=float, default=0.99,
+                        help='minimale Masken-IoU, sonst Exit-Code 1 (Standard: 0.99)')
+    args = parser.parse_args()
+
+    if args.calibration_dir and args.precision != 'int8':
+        parser.error('--calibration-dir gilt nur für --precision int8')
+
+    for name in args.models:
+        if args.calibration_dir:
+            quantize_static_int8(name, args.calibration_dir, args.calibration_limit)
+        else:
+            VARIANT_BUILDERS[args.precision](name)
+
+    # Schlägt im Build-Schritt fehl, statt eine zu ungenaue Variante auszuliefern -
+    # dann MODEL_PRECISION=fp16 bzw. fp32 setzen
+    if args.verify_dir:
+        failed = [name for name in args.models
+                  if verify_variant(name, args.precision, args.verify_dir) < args.min_iou]
+        if failed:
+            logger.error(f"❌ Masken-IoU unter {args.min_iou}: {', '.join(failed)}")
+            raise SystemExit(1)